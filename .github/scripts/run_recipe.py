@@ -1,30 +1,87 @@
 #!/usr/bin/env python3
 # File: .github/scripts/run_recipe.py
-# Updated to use Composio v3 API / Rube execution endpoint
+# Runs the recipe against the Composio v3 (default) or v1 Rube execution endpoint
 
+import argparse
+import gzip
+import hashlib
 import os
+import socket
 import sys
-import json
-import requests
 import time
+import traceback
+from dataclasses import dataclass
 from datetime import datetime
 
-# API Configuration
-API_BASE_URL = "https://backend.composio.dev/api/v3/rube"
+# API Configuration: Rube base URL per API version
+_ENDPOINTS = {
+    "v1": "https://backend.composio.dev/api/v1/rube",
+    "v3": "https://backend.composio.dev/api/v3/rube"
+}
+
+# (connect, read) timeouts in seconds: fail fast on an unreachable host,
+# but give the recipe up to 10 minutes to respond
+REQUEST_TIMEOUT = (10, 600)
+
+# Maximum bytes of a failed response body kept for logging
+ERROR_BODY_LIMIT = 8192
+
+# Request bodies larger than this are sent gzip-compressed
+GZIP_MIN_BYTES = 1024
+
+# Maximum bytes of the raw result echoed to the console; the full result
+# only goes to execution_log.json
+RESULT_PREVIEW_LIMIT = 2048
+
+# Result fields reported in the console summary
+SUMMARY_FIELDS = ("total_prospects_analyzed", "top_prospects_count", "relevant_events_count")
+
+# Longest Retry-After wait honoured before retrying, in seconds
+RETRY_AFTER_MAX = 60
+
+# Async execution polling: total budget and backoff bounds in seconds
+POLL_TIMEOUT = 540
+POLL_INITIAL_DELAY = 2
+POLL_MAX_DELAY = 15
+POLL_READ_TIMEOUT = 30
+POLL_RETRYABLE_4XX = {408, 429}
+COMPLETED_STATUSES = {"completed", "success", "succeeded"}
+FAILED_STATUSES = {"failed", "error", "cancelled"}
+
+# Recipe inputs: (input key, environment variable, default, caster)
+_INPUT_SPEC = (
+    ("prospect_spreadsheet_id", "PROSPECT_SPREADSHEET_ID", "", str),
+    ("line_log_spreadsheet_id", "LINE_LOG_SPREADSHEET_ID", "", str),
+    ("email_recipient", "EMAIL_RECIPIENT", "", str),
+    ("calendar_id", "CALENDAR_ID", "primary", str),
+    ("days_ahead", "DAYS_AHEAD", "21", int),
+    ("top_n_prospects", "TOP_N_PROSPECTS", "10", int)
+)
+_REQUIRED_INPUTS = {"prospect_spreadsheet_id", "line_log_spreadsheet_id", "email_recipient"}
+
+# Shared HTTP session, created on first use by get_session()
+_SESSION = None
+
+# Local binding avoids the attribute lookup on every log call
+_now = datetime.now
 
 def log(message):
     """Print timestamped log message"""
-    timestamp = datetime.now().isoformat()
-    print(f"[{timestamp}] {message}")
+    sys.stdout.write(f"[{_now().isoformat(timespec='seconds')}] {message}\n")
 
-def run_recipe():
-    """Execute Composio Recipe via Rube API"""
+@dataclass(frozen=True, slots=True)
+class RecipeConfig:
+    """Recipe settings snapshotted once from the environment"""
+    api_key: str
+    recipe_id: str
+    inputs: dict
 
-    log("=== Starting Market America Prospect Analysis ===")
+def load_config():
+    """Read and validate configuration from environment variables"""
+    env = os.environ.copy()
 
-    # Get configuration from environment variables
-    api_key = os.environ.get("COMPOSIO_API_KEY")
-    recipe_id = os.environ.get("RECIPE_ID")
+    api_key = env.get("COMPOSIO_API_KEY")
+    recipe_id = env.get("RECIPE_ID")
 
     if not api_key:
         log("ERROR: COMPOSIO_API_KEY not set")
@@ -34,164 +91,414 @@ def run_recipe():
         log("ERROR: RECIPE_ID not set")
         sys.exit(1)
 
-    # Prepare input data
-    input_data = {
-        "prospect_spreadsheet_id": os.environ.get("PROSPECT_SPREADSHEET_ID", ""),
-        "line_log_spreadsheet_id": os.environ.get("LINE_LOG_SPREADSHEET_ID", ""),
-        "email_recipient": os.environ.get("EMAIL_RECIPIENT", ""),
-        "calendar_id": os.environ.get("CALENDAR_ID", "primary"),
-        "days_ahead": os.environ.get("DAYS_AHEAD", "21"),
-        "top_n_prospects": os.environ.get("TOP_N_PROSPECTS", "10")
-    }
+    # Prepare and validate input data
+    input_data = {}
 
-    # Validate required inputs
-    if not input_data["prospect_spreadsheet_id"]:
-        log("ERROR: PROSPECT_SPREADSHEET_ID not set")
-        sys.exit(1)
-    if not input_data["line_log_spreadsheet_id"]:
-        log("ERROR: LINE_LOG_SPREADSHEET_ID not set")
-        sys.exit(1)
-    if not input_data["email_recipient"]:
-        log("ERROR: EMAIL_RECIPIENT not set")
-        sys.exit(1)
+    for key, env_name, default, cast in _INPUT_SPEC:
+        value = env.get(env_name, default)
+
+        if key in _REQUIRED_INPUTS and not value:
+            log(f"ERROR: {env_name} not set")
+            sys.exit(1)
+
+        try:
+            input_data[key] = cast(value)
+        except ValueError:
+            log(f"ERROR: {env_name} must be an integer, got {value!r}")
+            sys.exit(1)
+
+    return RecipeConfig(api_key=api_key, recipe_id=recipe_id, inputs=input_data)
+
+def get_session(api_key):
+    """Return the shared HTTP session so TCP/TLS connections are reused across calls"""
+    global _SESSION
+
+    if _SESSION is None:
+        # Imported here so configuration errors exit without loading the HTTP stack
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.connection import HTTPConnection
+        from urllib3.util.retry import Retry
+
+        # urllib3's defaults already disable Nagle (TCP_NODELAY); add keepalive
+        # probes so the connection survives the long wait for the recipe result
+        socket_options = HTTPConnection.default_socket_options + [
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        ]
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            socket_options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60))
+
+        class SocketOptionsAdapter(HTTPAdapter):
+            """HTTPAdapter that applies socket_options to every pooled connection"""
+
+            def init_poolmanager(self, *args, **kwargs):
+                kwargs["socket_options"] = socket_options
+                super().init_poolmanager(*args, **kwargs)
+
+        class CappedRetry(Retry):
+            """Retry that never sleeps longer than RETRY_AFTER_MAX on Retry-After"""
+
+            def get_retry_after(self, response):
+                retry_after = super().get_retry_after(response)
+                if retry_after is None:
+                    return None
+                return min(retry_after, RETRY_AFTER_MAX)
+
+        # Retry throttling and unavailability in-process instead of failing the
+        # whole job. Only 429 and 503 are retried: they mean the request was
+        # not accepted, while a 500/502/504 or a read error may come after the
+        # recipe already started server-side, and retrying would run it twice.
+        # POST is allowed for those two codes, and every execute call still
+        # carries an Idempotency-Key header. A stalled read must surface as a
+        # Timeout. A single status retry keeps the worst case (two 600 s
+        # attempts plus polling) inside the workflow's job timeout.
+        retry = CappedRetry(
+            total=5,
+            connect=3,
+            read=False,
+            status=1,
+            backoff_factor=1.5,
+            status_forcelist=(429, 503),
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS | {"POST"},
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+
+        adapter = SocketOptionsAdapter(
+            pool_connections=4,
+            pool_maxsize=10,
+            max_retries=retry
+        )
+
+        # Status polls are retried by poll_execution's own loop, which owns the
+        # polling deadline; adapter retries would let a single poll overrun it.
+        # The no-retry adapter shares the pool manager, so polls still reuse
+        # the execute call's TCP/TLS connection.
+        poll_adapter = HTTPAdapter(max_retries=0)
+        poll_adapter.poolmanager = adapter.poolmanager
+
+        _SESSION = requests.Session()
+        _SESSION.mount("https://", adapter)
+        for base_url in _ENDPOINTS.values():
+            _SESSION.mount(f"{base_url}/executions/", poll_adapter)
+
+        # Headers common to every call are set once on the session; requests'
+        # default Accept-Encoding already includes br when brotli is installed
+        _SESSION.headers.update({
+            "X-API-Key": api_key,
+            "Content-Type": "application/json"
+        })
+
+    return _SESSION
+
+def run_recipe(api="v3"):
+    """Execute Composio Recipe via Rube API"""
+
+    started_at = _now().isoformat()
+    log("=== Starting Market America Prospect Analysis ===")
+
+    config = load_config()
+
+    # HTTP and JSON libraries are only needed once configuration is valid
+    import orjson
+    import requests
+    import urllib3
+
+    session = get_session(config.api_key)
+    recipe_id = config.recipe_id
+    input_data = config.inputs
 
     log(f"Recipe ID: {recipe_id}")
-    log(f"Input data: {json.dumps(input_data, indent=2, ensure_ascii=False)}")
+    log(f"Input data: {orjson.dumps(input_data, option=orjson.OPT_INDENT_2).decode()}")
 
     # Call Composio Rube API to execute recipe
-    url = f"{API_BASE_URL}/recipe/execute"
-
-    headers = {
-        "X-API-Key": api_key,
-        "Content-Type": "application/json"
-    }
+    base_url = _ENDPOINTS[api]
+    url = f"{base_url}/recipe/execute"
 
     payload = {
         "recipe_id": recipe_id,
         "params": input_data
     }
 
+    # Idempotency key is stable across retries of this run, but distinct
+    # between runs so the daily schedule is never deduplicated against
+    # yesterday's execution
+    request_body = orjson.dumps(payload)
+    idempotency_key = hashlib.sha256(request_body + started_at.encode()).hexdigest()
+    request_headers = {"Idempotency-Key": idempotency_key}
+
+    if len(request_body) > GZIP_MIN_BYTES:
+        request_body = gzip.compress(request_body, compresslevel=1)
+        request_headers["Content-Encoding"] = "gzip"
+
     log(f"Calling Rube API: {url}")
 
-    try:
-        # Execute recipe
-        response = requests.post(
-            url, 
-            headers=headers, 
-            json=payload, 
-            timeout=600
-        )
+    # Filled in as the run progresses and written once on exit
+    log_data = {
+        "execution_time": _now().isoformat(timespec="seconds"),
+        "recipe_id": recipe_id,
+        "input": input_data,
+        "status": "pending"
+    }
 
-        log(f"Response status code: {response.status_code}")
+    def record_unexpected_error(exc_type, exc, tb):
+        """Mark the run failed in the execution log, then print the traceback"""
+        error_msg = f"Unexpected error: {exc_type.__name__}: {exc}"
+        log(f"ERROR: {error_msg}")
+        log_data.update({
+            "status": "failed",
+            "error": error_msg
+        })
+        save_log(log_data)
+        traceback.print_exception(exc_type, exc, tb)
 
-        if response.status_code not in [200, 201]:
-            error_msg = f"API request failed with status {response.status_code}"
+    # Anything not handled below is reported by the hook after the process unwinds
+    sys.excepthook = record_unexpected_error
+
+    try:
+        # Execute recipe, streaming so large error pages are never fully buffered
+        with session.post(
+            url,
+            data=request_body,
+            headers=request_headers,
+            timeout=REQUEST_TIMEOUT,
+            stream=True
+        ) as response:
+            status_code = response.status_code
+
+            if status_code in (200, 201):
+                body = response.content
+            else:
+                # raw.read bypasses requests' exception wrapping
+                try:
+                    body = response.raw.read(ERROR_BODY_LIMIT, decode_content=True)
+                except urllib3.exceptions.HTTPError as e:
+                    body = f"<failed to read response body: {e}>".encode()
+
+        log(f"Response status code: {status_code}")
+
+        if status_code not in (200, 201):
+            error_msg = f"API request failed with status {status_code}"
+            snippet = body.decode("utf-8", "replace")
             log(f"ERROR: {error_msg}")
-            log(f"Response: {response.text}")
+            log(f"Response: {snippet}")
 
-            # Save error log
-            save_log({
+            log_data.update({
                 "status": "failed",
                 "error": error_msg,
-                "response": response.text,
-                "status_code": response.status_code
+                "response": snippet,
+                "status_code": status_code
             })
 
             sys.exit(1)
 
-        result = response.json()
+        result = orjson.loads(body)
 
         log("Recipe execution initiated successfully!")
-        log(f"Result: {json.dumps(result, indent=2, ensure_ascii=False)}")
+        result_json = orjson.dumps(result, option=orjson.OPT_NON_STR_KEYS)
+        preview = result_json[:RESULT_PREVIEW_LIMIT].decode("utf-8", "ignore")
+        if len(result_json) > RESULT_PREVIEW_LIMIT:
+            preview += "..."
+        log(f"Result: {preview}")
 
         # Check if execution is async
         execution_id = result.get("execution_id")
 
         if execution_id:
             log(f"Recipe executing asynchronously with execution_id: {execution_id}")
-            log("Results will be available in spreadsheet and email when complete")
-
-            # Save success log
-            save_log({
-                "status": "started",
-                "execution_id": execution_id,
-                "recipe_id": recipe_id,
-                "input": input_data,
-                "message": "Recipe execution started successfully",
-                "note": "Results will be updated to spreadsheet and sent via email"
-            })
 
-            log("✅ Analysis started successfully!")
-            log("📊 Results will be available in 3-5 minutes")
-            log("📧 You will receive an email notification when complete")
+            status_result = poll_execution(session, base_url, execution_id)
+
+            if status_result is None:
+                # Completion could not be confirmed, rely on the email report
+                log("Results will be available in spreadsheet and email when complete")
+
+                log_data.update({
+                    "status": "started",
+                    "execution_id": execution_id,
+                    "message": "Recipe execution started successfully",
+                    "note": "Results will be updated to spreadsheet and sent via email"
+                })
+
+                log("✅ Analysis started successfully!")
+                log("📊 Results will be available in 3-5 minutes")
+                log("📧 You will receive an email notification when complete")
+
+                sys.exit(0)
+
+            execution_status = status_result.get("status")
+
+            if execution_status in FAILED_STATUSES:
+                error_msg = f"Recipe execution {execution_id} finished with status {execution_status}"
+                log(f"ERROR: {error_msg}")
+
+                log_data.update({
+                    "status": "failed",
+                    "execution_id": execution_id,
+                    "error": error_msg,
+                    "response": status_result
+                })
+
+                sys.exit(1)
+
+            log("Recipe execution completed")
+            result = status_result
 
         else:
             # Sync execution
             log("Recipe executed synchronously")
 
-            # Extract results
-            data = result.get("data", result)
-
-            save_log({
-                "status": "success",
-                "recipe_id": recipe_id,
-                "input": input_data,
-                "result": data,
-                "total_prospects": data.get("total_prospects_analyzed"),
-                "top_prospects": data.get("top_prospects_count"),
-                "events": data.get("relevant_events_count")
-            })
+        # Extract results
+        data = result.get("data", result)
 
-            log("✅ Analysis completed successfully!")
+        log_data.update({
+            "status": "success",
+            "result": data,
+            "total_prospects": data.get("total_prospects_analyzed"),
+            "top_prospects": data.get("top_prospects_count"),
+            "events": data.get("relevant_events_count")
+        })
 
-            if data.get("spreadsheet_updated"):
-                log("📊 Spreadsheet updated")
-            if data.get("email_sent"):
-                log("📧 Email report sent")
+        log("✅ Analysis completed successfully!")
+        log(f"Summary: {orjson.dumps(_summarize(data)).decode()}")
+
+        if data.get("spreadsheet_updated"):
+            log("📊 Spreadsheet updated")
+        if data.get("email_sent"):
+            log("📧 Email report sent")
 
         sys.exit(0)
 
-    except requests.exceptions.Timeout:
-        error_msg = "Request timeout after 10 minutes"
+    except requests.exceptions.ConnectTimeout:
+        error_msg = f"Could not connect to Rube API within {REQUEST_TIMEOUT[0]} seconds"
         log(f"ERROR: {error_msg}")
-        save_log({
+        log_data.update({
             "status": "failed",
             "error": error_msg
         })
         sys.exit(1)
 
-    except requests.exceptions.RequestException as e:
-        error_msg = f"Request failed: {str(e)}"
+    except requests.exceptions.Timeout:
+        error_msg = "Request timeout after 10 minutes"
         log(f"ERROR: {error_msg}")
-        save_log({
+        log_data.update({
             "status": "failed",
             "error": error_msg
         })
         sys.exit(1)
 
-    except Exception as e:
-        error_msg = f"Unexpected error: {str(e)}"
+    except requests.exceptions.RequestException as e:
+        error_msg = f"Request failed: {str(e)}"
         log(f"ERROR: {error_msg}")
-        save_log({
+        log_data.update({
             "status": "failed",
             "error": error_msg
         })
         sys.exit(1)
 
-def save_log(data):
+    finally:
+        # A run still pending here is unwinding from an unexpected error;
+        # record_unexpected_error writes the log for it
+        if log_data["status"] != "pending":
+            save_log(log_data)
+
+def _summarize(data):
+    """Pick the headline counts from a recipe result for console output"""
+    return {field: data.get(field) for field in SUMMARY_FIELDS}
+
+def poll_execution(session, base_url, execution_id):
+    """Poll async execution status until it finishes or the budget runs out
+
+    Returns the final status payload, or None if completion could not be
+    confirmed (status endpoint unavailable or still running at the deadline).
+    """
+    import orjson
+    import requests
+
+    url = f"{base_url}/executions/{execution_id}"
+    deadline = time.monotonic() + POLL_TIMEOUT
+    delay = POLL_INITIAL_DELAY
+
+    log(f"Polling execution status: {url}")
+
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            log(f"Execution still running after {POLL_TIMEOUT} seconds, stop polling")
+            return None
+
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 1.5, POLL_MAX_DELAY)
+
+        # Cap each status call by what is left of the polling budget
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            continue
+        poll_timeout = (min(REQUEST_TIMEOUT[0], remaining), min(POLL_READ_TIMEOUT, remaining))
+
+        try:
+            response = session.get(url, timeout=poll_timeout)
+        except requests.exceptions.RequestException as e:
+            log(f"Warning: Status poll failed: {e}")
+            continue
+
+        # Client errors other than timeout/throttling will not go away by polling
+        if 400 <= response.status_code < 500 and response.status_code not in POLL_RETRYABLE_4XX:
+            log(f"Execution status endpoint not available ({response.status_code}), stop polling")
+            return None
+
+        if response.status_code != 200:
+            log(f"Warning: Status poll returned {response.status_code}")
+            continue
+
+        # Polling is best effort: an unusable body means no confirmed status
+        try:
+            status_result = orjson.loads(response.content)
+        except orjson.JSONDecodeError:
+            log("Warning: Status poll returned invalid JSON, stop polling")
+            return None
+
+        if not isinstance(status_result, dict) or not isinstance(status_result.get("status"), str):
+            log("Warning: Status poll response has no status field, stop polling")
+            return None
+
+        execution_status = status_result["status"]
+        log(f"Execution status: {execution_status}")
+
+        if execution_status in COMPLETED_STATUSES or execution_status in FAILED_STATUSES:
+            return status_result
+
+def save_log(log_data):
     """Save execution log to file"""
-    log_data = {
-        "execution_time": datetime.now().isoformat(),
-        "recipe_id": os.environ.get("RECIPE_ID"),
-        **data
-    }
+    import orjson
 
     try:
-        with open("execution_log.json", "w", encoding="utf-8") as f:
-            json.dump(log_data, f, indent=2, ensure_ascii=False)
+        content = memoryview(orjson.dumps(log_data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+
+        # Write the bytes straight to the descriptor, bypassing io buffering
+        fd = os.open("execution_log.json", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            while content:
+                content = content[os.write(fd, content):]
+        finally:
+            os.close(fd)
+
         log("Execution log saved to execution_log.json")
     except Exception as e:
         log(f"Warning: Failed to save log: {e}")
 
+def main():
+    """Parse command line arguments and run the recipe"""
+    parser = argparse.ArgumentParser(description="Run the Market America prospect analysis recipe")
+    parser.add_argument(
+        "--api-version",
+        choices=sorted(_ENDPOINTS),
+        default="v3",
+        help="Composio Rube API version to call (default: v3)"
+    )
+    args = parser.parse_args()
+
+    run_recipe(args.api_version)
+
 if __name__ == "__main__":
-    run_recipe()
+    main()